@@ -16,13 +16,25 @@
 #    plotly
 #    prophet==1.1.6
 #    requests
+#    httpx
+#    orjson
+#    numpy
 #    python-dotenv
 #    openpyxl
+#    pyarrow
 #    cmdstanpy
 
+import asyncio
 import os
 from datetime import datetime
+
+import httpx
+import numpy as np
+import orjson
+import pyarrow as pa
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import pandas as pd
 import plotly.express as px
@@ -39,6 +51,11 @@ GRADES = {"RBS": "Regular Bold 46‑48 lbs", "NC": "Northern Cone 48 lbs"}
 ORIGINS = {"Ghana": "GH", "Côte d'Ivoire": "CI", "Guinea": "GN", "Tanzania": "TZ", "Benin": "BJ"}
 PORT_CODE_TUTICORIN = "INTUT1"
 
+# Only the workbook columns the dashboard actually reads — the file has
+# ~40 columns and parsing the rest through openpyxl is pure waste.
+XLS_USECOLS = ["PORT CODE", "DATE", "IMPORTER", "COUNTRY OF_ORIGIN", "GOODS DESCRIPTION", "QUANTITY", "UNIT PRICE_USD", "TOTAL VALUE_USD"]
+XLS_DTYPES = {"PORT CODE": "string", "IMPORTER": "string", "COUNTRY OF_ORIGIN": "string", "GOODS DESCRIPTION": "string"}
+
 COMTRADE_KEY = os.getenv("COMTRADE_API_KEY", "")
 BASE_COMTRADE = "https://api.un.org/data/comtrade/v1"
 MARINETRAFFIC_KEY = os.getenv("MARINETRAFFIC_KEY", "")
@@ -48,21 +65,60 @@ BASE_MT = "https://services.marinetraffic.com/api/vesselmasterdata/vesselmasterd
 # HELPERS
 # ------------------------------------------------------------------
 
+@st.cache_resource(show_spinner=False)
+def http_session() -> requests.Session:
+    s = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def _parse_fob(payload: bytes) -> float:
+    recs = orjson.loads(payload).get("data", [])
+    if not recs:
+        return None
+    tv = np.array([np.nan if rec.get("TradeValue") is None else rec["TradeValue"] for rec in recs], dtype=np.float64)
+    qty = np.array([np.nan if rec.get("qty") is None else rec["qty"] for rec in recs], dtype=np.float64)
+    m = (qty > 0) & ~np.isnan(tv)
+    vals = tv[m] / qty[m]
+    return float(vals.mean()) if vals.size else None
+
+
+@st.cache_data(ttl="1h", max_entries=256, show_spinner=False)
 def comtrade_price(origin_iso: str, year: int) -> float:
     url = f"{BASE_COMTRADE}/commtrade?max=500&r={origin_iso}&px=HS&cc=080131&ps={year}&freq=A&type=C&token={COMTRADE_KEY}"
     try:
-        js = requests.get(url, timeout=30).json()
-        vals = [rec["TradeValue"] / rec["qty"] for rec in js.get("data", []) if rec.get("qty")]
-        return sum(vals) / len(vals) if vals else None
+        return _parse_fob(http_session().get(url, timeout=30).content)
+    except Exception:
+        return None
+
+
+async def _comtrade_price_async(client: httpx.AsyncClient, origin_iso: str, year: int) -> float:
+    url = f"{BASE_COMTRADE}/commtrade?max=500&r={origin_iso}&px=HS&cc=080131&ps={year}&freq=A&type=C&token={COMTRADE_KEY}"
+    try:
+        return _parse_fob((await client.get(url, timeout=30)).content)
     except Exception:
         return None
 
 
+async def _fan_out(isos: tuple, year: int) -> list:
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=16)) as client:
+        return await asyncio.gather(*[_comtrade_price_async(client, iso, year) for iso in isos])
+
+
+@st.cache_data(ttl="1h", max_entries=256, show_spinner=False)
+def comtrade_prices(isos: tuple, year: int) -> dict:
+    return dict(zip(isos, asyncio.run(_fan_out(isos, year))))
+
+
+@st.cache_data(ttl="10m", max_entries=8, show_spinner=False)
 def mt_expected(limit: int = 20) -> pd.DataFrame:
     if not MARINETRAFFIC_KEY:
         return pd.DataFrame()
     try:
-        js = requests.get(f"{BASE_MT}/{MARINETRAFFIC_KEY}/portid:403?protocol=json", timeout=30).json()
+        js = http_session().get(f"{BASE_MT}/{MARINETRAFFIC_KEY}/portid:403?protocol=json", timeout=30).json()
         rows = [{"Vessel": v.get("SHIPNAME"), "ETA": v.get("ETA"), "Last Port": v.get("LAST_PORT_NAME"), "Cargo": v.get("CARGO_TYPE_SUMMARY") } for v in js[:limit]]
         return pd.DataFrame(rows)
     except Exception:
@@ -73,11 +129,42 @@ def mt_expected(limit: int = 20) -> pd.DataFrame:
 # ------------------------------------------------------------------
 @st.cache_data(show_spinner=False)
 def load_data(xls: str) -> pd.DataFrame:
-    df = pd.read_excel(xls, header=5, engine="openpyxl")
-    df["DATE"] = pd.to_datetime(df["DATE"], errors="coerce")
+    # Parquet sidecar: openpyxl takes tens of seconds on a cold cache,
+    # pyarrow reads the same frame back in tens of milliseconds.
+    pq_path = xls + ".parquet"
+    if os.path.exists(pq_path) and os.path.getmtime(pq_path) >= os.path.getmtime(xls):
+        df = pd.read_parquet(pq_path, engine="pyarrow")
+        if set(XLS_USECOLS) <= set(df.columns) and df["DATE"].is_monotonic_increasing:
+            return df  # else: sidecar written by an older loader, rebuild it
+    df = pd.read_excel(xls, header=5, engine="openpyxl", usecols=XLS_USECOLS, dtype=XLS_DTYPES)
+    # Filter before any coercion: less than half the workbook is Tuticorin,
+    # so the datetime/numeric passes below run on the small frame.
     df = df[df["PORT CODE"] == PORT_CODE_TUTICORIN]
+    df["DATE"] = pd.to_datetime(df["DATE"], errors="coerce")
     for c in ["QUANTITY", "UNIT PRICE_USD", "TOTAL VALUE_USD"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+    # Derived date columns so reruns filter on plain integers instead of
+    # re-running .dt accessors over the whole frame.
+    df["YEAR"] = df["DATE"].dt.year.astype("int16")
+    df["MONTH_NUM"] = df["DATE"].dt.month.astype("int8")
+    df["MONTH_TS"] = df["DATE"].values.astype("datetime64[M]").astype("datetime64[ns]")
+    # Tag each row with its grade once here so the forecast filter is a
+    # categorical equality check instead of a str.contains scan per rerun.
+    df["GRADE"] = pd.NA
+    for g in GRADES:
+        df.loc[df["GRADE"].isna() & df["GOODS DESCRIPTION"].str.contains(g, na=False), "GRADE"] = g
+    df["GRADE"] = df["GRADE"].astype("category")
+    # Low-cardinality text -> category: roughly halves the frame's memory
+    # footprint and speeds up the groupbys over these keys.
+    for c in ["PORT CODE", "IMPORTER", "COUNTRY OF_ORIGIN", "GOODS DESCRIPTION"]:
+        df[c] = df[c].astype("category")
+    # Sort once by DATE so date-range queries become searchsorted slices
+    # and "tail" genuinely means the most recent shipments.
+    df = df.sort_values("DATE", kind="stable", ignore_index=True)
+    try:
+        df.to_parquet(pq_path, engine="pyarrow", compression="zstd")
+    except OSError:
+        pass  # read-only deploys still work, just without the sidecar
     return df
 
 LOCAL_XLS = "RCN JAN 2020 TO DEC 2024.xlsx"
@@ -85,21 +172,77 @@ if not os.path.exists(LOCAL_XLS):
     st.stop()
 imp = load_data(LOCAL_XLS)
 
+# ------------------------------------------------------------------
+# CACHED AGGREGATES
+# ------------------------------------------------------------------
+# imp is immutable between loads, so these groupby passes only need to
+# run once instead of on every widget interaction.
+
+@st.cache_data(show_spinner=False)
+def latest_cif(df: pd.DataFrame) -> float:
+    # The frame is sorted by DATE at load, so the tail holds the 500 most
+    # recent shipments; computed once per load.
+    return float(df["UNIT PRICE_USD"].tail(500).mean())
+
+
+@st.cache_data(show_spinner=False)
+def top_buyers(df: pd.DataFrame) -> pd.DataFrame:
+    tbl = pa.Table.from_pandas(df[["IMPORTER", "UNIT PRICE_USD", "QUANTITY"]], preserve_index=False)
+    agg = tbl.group_by("IMPORTER").aggregate([("UNIT PRICE_USD", "mean"), ("QUANTITY", "sum")])
+    out = agg.rename_columns(["IMPORTER", "mean_price", "vol"]).to_pandas()
+    return out.nlargest(10, "mean_price")
+
+
+@st.cache_data(show_spinner=False)
+def monthly_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    # One (month, grade) pass feeds both the forecast input (per-grade
+    # monthly mean price) and the T4 volume chart (sums are composable).
+    return (
+        df.groupby(["MONTH_TS", "GRADE"], observed=True, dropna=False)
+        .agg(price=("UNIT PRICE_USD", "mean"), qty=("QUANTITY", "sum"))
+        .reset_index()
+    )
+
+
+@st.cache_data(show_spinner=False)
+def vol_monthly(df: pd.DataFrame) -> pd.Series:
+    r = monthly_rollup(df)
+    return r.groupby(r["MONTH_TS"].dt.month)["qty"].sum().rename_axis("MONTH_NUM") / 1000
+
+
+@st.cache_data(show_spinner=False)
+def top_orig(df: pd.DataFrame, cutoff: pd.Timestamp) -> pd.Series:
+    # DATE is sorted at load, so the window is a binary-search slice; the
+    # cutoff is day-normalised so the cache key is stable within a day.
+    last12 = df.iloc[df["DATE"].searchsorted(cutoff, side="left"):]
+    return last12.groupby("COUNTRY OF_ORIGIN", observed=True)["QUANTITY"].sum().nlargest(10) / 1000
+
+
 # ------------------------------------------------------------------
 # FORECAST
 # ------------------------------------------------------------------
+@st.cache_resource(show_spinner=False)
+def fit_prophet(grade: str, month_key: str, _mdf: pd.DataFrame) -> Prophet:
+    # Keyed on (grade, current month): the model only retrains when a new
+    # month of data can exist, instead of whenever the cache_data hash churns.
+    # MAP fit only: the chart plots yhat alone, so skip the Monte Carlo
+    # uncertainty draws, and a tighter changepoint prior keeps the
+    # optimiser off the sparse monthly series' noise.
+    m = Prophet(yearly_seasonality=True, mcmc_samples=0, uncertainty_samples=0, changepoint_prior_scale=0.01)
+    m.fit(_mdf.rename(columns={"UNIT PRICE_USD": "y"}))
+    return m
+
+
 @st.cache_data(show_spinner=False)
 def forecast_price(df: pd.DataFrame, grade: str):
-    sub = df[df["GOODS DESCRIPTION"].str.contains(grade, na=False)].copy()
-    sub["ds"] = sub["DATE"].dt.to_period("M").dt.to_timestamp()
-    mdf = sub.groupby("ds")["UNIT PRICE_USD"].mean().reset_index().dropna()
+    r = monthly_rollup(df)
+    mdf = r.loc[r["GRADE"] == grade, ["MONTH_TS", "price"]].rename(columns={"MONTH_TS": "ds", "price": "UNIT PRICE_USD"}).dropna()
     if len(mdf) < 12:
         return None
-    m = Prophet(yearly_seasonality=True)
-    m.fit(mdf.rename(columns={"UNIT PRICE_USD": "y"}))
-    fc = m.predict(m.make_future_dataframe(6, freq="MS"))
-    fc["ds"] = fc["ds"].dt.strftime("%Y-%m-%d")
-    return fc
+    m = fit_prophet(grade, datetime.now().strftime("%Y-%m"), mdf)
+    # Keep ds as datetime64 — plotly renders it natively and the per-row
+    # strftime cast was pure overhead.
+    return m.predict(m.make_future_dataframe(6, freq="MS"))
 
 # ------------------------------------------------------------------
 # UI
@@ -111,12 +254,17 @@ origins_sel = st.sidebar.multiselect("Origins", list(ORIGINS), default=list(ORIG
 
 st.title("RCN Trader Command‑Center")
 col1, col2, col3 = st.columns(3)
-col1.metric("Avg CIF (last 500 rows)", f"${imp.tail(500)['UNIT PRICE_USD'].mean():,.0f}/t")
+col1.metric("Avg CIF (last 500 rows)", f"${latest_cif(imp):,.0f}/t")
 ref = origins_sel[0] if origins_sel else "Ghana"
-price = comtrade_price(ORIGINS[ref], datetime.now().year - 1)
+# Only touch the Comtrade path when the reference origin actually changed;
+# unrelated widget reruns reuse the price memoised in this session.
+if st.session_state.get("fob_ref") != ref:
+    st.session_state["fob_ref"] = ref
+    st.session_state["fob_price"] = comtrade_price(ORIGINS[ref], datetime.now().year - 1)
+price = st.session_state["fob_price"]
 if price:
     col2.metric(f"FOB {ref}", f"${price:,.0f}/t")
-col3.metric("2024 volume", f"{imp[imp['DATE'].dt.year==2024]['QUANTITY'].sum()/1000:,.0f} t")
+col3.metric("2024 volume", f"{imp.loc[imp['YEAR'].eq(2024), 'QUANTITY'].sum()/1000:,.0f} t")
 
 T1, T2, T3, T4 = st.tabs(["Price", "Buy/Sell", "Vessels", "History"])
 
@@ -128,12 +276,17 @@ with T1:
         st.info("Not enough data for forecast")
 
 with T2:
-    buys = [{"Origin": o, "FOB USD/t": comtrade_price(iso, datetime.now().year - 1)} for o, iso in ORIGINS.items() if o in origins_sel]
+    sel_isos = tuple(iso for o, iso in ORIGINS.items() if o in origins_sel)
+    fobs = comtrade_prices(sel_isos, datetime.now().year - 1)
+    buys = [{"Origin": o, "FOB USD/t": fobs.get(iso)} for o, iso in ORIGINS.items() if o in origins_sel]
     st.dataframe(pd.DataFrame(buys).dropna().sort_values("FOB USD/t"))
-    buyers = imp.groupby("IMPORTER")[["UNIT PRICE_USD", "QUANTITY"]].agg(mean_price=("UNIT PRICE_USD", "mean"), vol=("QUANTITY", "sum")).reset_index().sort_values("mean_price", ascending=False).head(10)
+    buyers = top_buyers(imp)
     st.dataframe(buyers.rename(columns={"IMPORTER": "Buyer", "mean_price": "Avg USD/t", "vol": "Vol kg"}))
 
-with T3:
+@st.fragment(run_every="10m")
+def vessel_board():
+    # Fragment: ETA refreshes rerun only this block, and sidebar reruns
+    # elsewhere never block on the AIS fetch.
     vdf = mt_expected()
     if vdf.empty:
         st.info("Add MARINETRAFFIC_KEY for live ETA")
@@ -141,11 +294,13 @@ with T3:
         vdf["ETA"] = pd.to_datetime(vdf["ETA"], errors="coerce")
         st.dataframe(vdf)
 
+with T3:
+    vessel_board()
+
 with T4:
-    month = imp.groupby(imp["DATE"].dt.month)["QUANTITY"].sum()/1000
-    st.bar_chart(month)
-    last12 = imp[imp["DATE"] >= (datetime.now() - pd.DateOffset(years=1))]
-    top_orig = last12.groupby("COUNTRY OF_ORIGIN")["QUANTITY"].sum().sort_values(ascending=False).head(10)/1000
-    st.dataframe(top_orig.reset_index().rename(columns={"COUNTRY OF_ORIGIN": "Origin", "QUANTITY": "t"}))
+    st.bar_chart(vol_monthly(imp))
+    cutoff = pd.Timestamp.today().normalize() - pd.DateOffset(years=1)
+    origins = top_orig(imp, cutoff)
+    st.dataframe(origins.reset_index().rename(columns={"COUNTRY OF_ORIGIN": "Origin", "QUANTITY": "t"}))
 
 st.caption("Made with Streamlit – last updated auto")